@@ -108,6 +108,7 @@ Note that, while using a library to access Prolog will normally end and restart
 import json
 import logging
 import os
+import re
 import socket
 import subprocess
 import unittest
@@ -119,6 +120,29 @@ from pathlib import PurePath, PurePosixPath, PureWindowsPath
 from tempfile import gettempdir
 from time import sleep
 
+# Responses are parsed with orjson when it is installed since it is much faster than json
+try:
+    import orjson
+
+    # orjson turns integers that don't fit in 64 bits into floats but Prolog integers are unbounded.
+    # Every integer with fewer than 19 digits fits, so only text without longer runs of digits is given to orjson
+    _long_digit_run = re.compile(r"\d{19}")
+
+    def _json_loads(text):
+        if _long_digit_run.search(text) is None:
+            with suppress(orjson.JSONDecodeError):
+                return orjson.loads(text)
+        return json.loads(text)
+
+except ImportError:
+    _json_loads = json.loads
+
+# Size of the buffer each PrologThread receives messages into. It grows to fit larger messages, but once
+# a message needed more than _receive_buffer_max_kept bytes it goes back to this size so one large answer
+# doesn't keep its memory allocated for the life of the thread
+_receive_buffer_size = 4096
+_receive_buffer_max_kept = 65536
+
 
 class PrologError(Exception):
     """
@@ -519,6 +543,9 @@ class PrologThread:
         self._heartbeat_count = 0
         self._server_protocol_major = None
         self._server_protocol_minor = None
+        # Messages are received directly into this buffer, see _grow_receive_buffer()
+        self._receive_buffer = bytearray(_receive_buffer_size)
+        self._receive_view = memoryview(self._receive_buffer)
 
     def __enter__(self):
         self.start()
@@ -554,6 +581,8 @@ class PrologThread:
         else:
             prologAddress = ("127.0.0.1", self._prolog_server._port)
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Messages are small and each one waits for a reply, so don't let Nagle's algorithm delay them
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
         _log.debug("PrologMQI connecting to Prolog at: %s", prologAddress)
 
@@ -577,7 +606,7 @@ class PrologThread:
         # Send the password as the first message
         self._send(f"{self._prolog_server._password}")
         result = self._receive()
-        jsonResult = json.loads(result)
+        jsonResult = _json_loads(result)
         if prolog_name(jsonResult) != "true":
             raise PrologLaunchError(
                 f"Failed to accept password: {json_to_prolog(jsonResult)}"
@@ -806,13 +835,16 @@ class PrologThread:
     #   PrologResultNotAvailableError if query_async_result is called with a timeout and the result is not available
     def _return_prolog_response(self):
         result = self._receive()
-        jsonResult = json.loads(result)
-        if prolog_name(jsonResult) == "exception":
-            if jsonResult["args"][0] == "no_more_results":
+        jsonResult = _json_loads(result)
+        # Computed once since this runs for every response
+        responseName = prolog_name(jsonResult)
+        if responseName == "exception":
+            exceptionArg = jsonResult["args"][0]
+            if exceptionArg == "no_more_results":
                 return None
-            elif jsonResult["args"][0] == "connection_failed":
+            elif exceptionArg == "connection_failed":
                 self._prolog_server.connection_failed = True
-            elif not isinstance(jsonResult["args"][0], str):
+            elif not isinstance(exceptionArg, str):
                 raise PrologError(jsonResult)
 
             raise {
@@ -821,22 +853,21 @@ class PrologThread:
                 "no_query": PrologNoQueryError(jsonResult),
                 "cancel_goal": PrologQueryCancelledError(jsonResult),
                 "result_not_available": PrologResultNotAvailableError(jsonResult),
-            }.get(jsonResult["args"][0], PrologError(jsonResult))
+            }.get(exceptionArg, PrologError(jsonResult))
         else:
-            if prolog_name(jsonResult) == "false":
+            if responseName == "false":
                 return False
-            elif prolog_name(jsonResult) == "true":
+            elif responseName == "true":
                 answerList = []
-                for answer in prolog_args(jsonResult)[0]:
+                for answer in jsonResult["args"][0]:
                     if len(answer) == 0:
                         answerList.append(True)
                     else:
                         answerDict = {}
                         for answerAssignment in answer:
                             # These will all be =(Variable, Term) terms
-                            answerDict[prolog_args(answerAssignment)[0]] = prolog_args(
-                                answerAssignment
-                            )[1]
+                            variable, value = answerAssignment["args"]
+                            answerDict[variable] = value
                         answerList.append(answerDict)
                 if answerList == [True]:
                     return True
@@ -858,9 +889,8 @@ class PrologThread:
         else:
             messageLen = len(utf8Value)
 
-        msgHeader = f"{str(messageLen)}.\n".encode("utf-8")
-        self._socket.sendall(msgHeader)
-        self._socket.sendall(utf8Value)
+        # Send the header and the message together so they go out in one write
+        self._socket.sendall(b"%d.\n%b" % (messageLen, utf8Value))
 
     #  The format of sent and received messages is identical: `<stringByteLength>.\n<stringBytes>.\n`. For example: `7.\nhello.\n`:
     #  - `<stringByteLength>` is the number of bytes of the string to follow (including the `.\n`), in human readable numbers, such as `15` for a 15 byte string. It must be followed by `.\n`.
@@ -868,47 +898,58 @@ class PrologThread:
     # heartbeats (the "." character) can be sent by some commands to ensure the client is still listening.  These are discarded.
     def _receive(self):
         # Look for the response
-        amount_received = 0
         amount_expected = None
-        bytesReceived = bytearray()
         sizeBytes = bytearray()
         self._heartbeat_count = 0
 
-        data = None
-        while amount_expected is None or amount_received < amount_expected:
-            headerData = self._socket.recv(4096)
-            if amount_expected is None:
-                # Start / continue reading the string length
-                # Ignore any leading "." characters because those are heartbeats
-                for index, item in enumerate(headerData):
-                    # String length ends with '.\n' characters
-                    if chr(item) == ".":
-                        # ignore "."
-                        if len(sizeBytes) == 0:
-                            # Count heartbeats for testing only
-                            self._heartbeat_count += 1
-                        continue
-                    if chr(item) == "\n":
-                        # convert all the characters we've received so far to a number
-                        stringLength = "".join(chr(code) for code in sizeBytes)
-                        amount_expected = int(stringLength)
-                        # And consume the rest of the stream
-                        data = bytearray(headerData[index + 1 :])
-                        break
-                    else:
-                        sizeBytes.append(item)
-                if data is None:
+        while amount_expected is None:
+            amount_received = self._socket.recv_into(self._receive_view)
+            # Start / continue reading the string length
+            # Ignore any leading "." characters because those are heartbeats
+            for index in range(amount_received):
+                item = self._receive_buffer[index]
+                # String length ends with '.\n' characters
+                if chr(item) == ".":
+                    # ignore "."
+                    if len(sizeBytes) == 0:
+                        # Count heartbeats for testing only
+                        self._heartbeat_count += 1
                     continue
-            else:
-                data = headerData
+                if chr(item) == "\n":
+                    # convert all the characters we've received so far to a number
+                    amount_expected = int(sizeBytes)
+                    # And keep the start of the message that came along with the length
+                    start = index + 1
+                    amount_received -= start
+                    self._grow_receive_buffer(amount_expected)
+                    self._receive_view[:amount_received] = self._receive_view[start : start + amount_received]
+                    break
+                else:
+                    sizeBytes.append(item)
 
-            amount_received += len(data)
-            bytesReceived += data
+        # Receive the rest of the message directly into the buffer after what has arrived so far
+        while amount_received < amount_expected:
+            amount_received += self._socket.recv_into(
+                self._receive_view[amount_received:amount_expected]
+            )
 
-        finalValue = bytesReceived.decode("utf-8")
+        finalValue = str(self._receive_view[:amount_expected], "utf-8")
+        if len(self._receive_buffer) > _receive_buffer_max_kept:
+            self._replace_receive_buffer(bytearray(_receive_buffer_size))
         _log.debug("PrologMQI receive: %s", finalValue)
         return finalValue
 
+    def _grow_receive_buffer(self, size):
+        if size > len(self._receive_buffer):
+            newBuffer = bytearray(max(size, 2 * len(self._receive_buffer)))
+            newBuffer[: len(self._receive_buffer)] = self._receive_buffer
+            self._replace_receive_buffer(newBuffer)
+
+    def _replace_receive_buffer(self, newBuffer):
+        self._receive_view.release()
+        self._receive_buffer = newBuffer
+        self._receive_view = memoryview(newBuffer)
+
 
 def create_posix_path(os_path):
     """